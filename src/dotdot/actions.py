@@ -1,16 +1,31 @@
 from __future__ import annotations
 
+import functools
+import itertools
 import os
 import os.path
+import shlex
 import shutil
+import stat
 import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from pathlib import Path
-from typing import Any, Optional, Sequence, Type, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union)
 
 from dotdot.exceptions import InvalidActionDescription, InvalidActionType
 from dotdot.spec import SPEC_FILE_NAME
-from git.repo import Repo
 
 # ############
 # Action store
@@ -38,39 +53,214 @@ def get_actions_help() -> dict:
 
 
 def action_class_from_str(s: str) -> Type[BaseAction]:
-    s = s.lower()
+    # spec keys are usually already lower case, only normalize them when the
+    # exact key is not registered
+    action_cls = __ACTION_STORE.get(s) or __ACTION_STORE.get(s.lower())
+    if action_cls is None:
+        raise InvalidActionType(s.lower())
 
-    try:
-        return __ACTION_STORE[s]
-    except KeyError:
-        raise InvalidActionType(s)
+    return action_cls
 
 
 # #################
 # Utility functions
+# names known to exist on each directory, filled by mk_backup_name
+__EXISTING_NAMES: dict[str, set[str]] = {}
+# different files may share a backup name (.a and _a), and links are created
+# from several threads
+__BACKUP_NAMES_LOCK = threading.Lock()
+
+# upper bound for the numeric suffix of backup files
+MAX_BACKUPS = 1 << 16
+
+# links are created in parallel only for batches of at least this many links
+SYMLINK_BATCH_MIN = 8
+SYMLINK_WORKERS = 8
+
+# how many repos are cloned or updated at the same time
+GIT_CLONE_WORKERS = 8
+
+
+def expand_home(path: str, home: str) -> str:
+    """expands a leading ~ in path to the given home
+
+    Same as os.path.expanduser for the current user, without looking $HOME up
+    again for every path. `~user` paths are still handed to expanduser
+    """
+    if not path.startswith('~'):
+        return path
+
+    if path == '~' or path.startswith('~' + os.sep):
+        return home + path[1:]
+
+    return os.path.expanduser(path)
+
+
 def mk_backup_name(file_name: str) -> str:
     """creates a backup file name for a given file"""
-    name = os.path.basename(file_name)
-    dir_name = os.path.dirname(file_name)
+    with __BACKUP_NAMES_LOCK:
+        return _mk_backup_name(file_name)
+
+
+def _mk_backup_name(file_name: str) -> str:
+    dir_name, name = os.path.split(file_name)
     dir_name = os.path.expanduser(dir_name)
 
     bk_name = f'{name}.bk'
     if bk_name[0] == '.':
         bk_name = '_' + bk_name[1:]
 
-    i = 1
-    attempt = bk_name
+    # each directory is listed only once per run, instead of one lstat per
+    # attempt on every call
+    dir_key = os.path.abspath(dir_name or '.')
+    existing = __EXISTING_NAMES.get(dir_key)
+    if existing is None:
+        try:
+            existing = set(os.listdir(dir_key))
+        except FileNotFoundError:
+            existing = set()
+
+        __EXISTING_NAMES[dir_key] = existing
 
-    while os.path.lexists(os.path.join(dir_name, attempt)):
-        attempt = f'{bk_name}.{i}'
-        i += 1
+    def attempt_name(i: int) -> str:
+        return f'{bk_name}.{i}' if i else bk_name
 
-        if i > 10:
-            raise Exception(f'Too many backup files for {file_name}')
+    def taken(i: int) -> bool:
+        attempt = attempt_name(i)
+        if attempt in existing:
+            return True
+
+        # the listing may be outdated, confirm the free name
+        if os.path.lexists(os.path.join(dir_name, attempt)):
+            existing.add(attempt)
+            return True
+
+        return False
+
+    # backups are numbered in sequence, so the first free suffix is found by
+    # doubling the suffix until a free one shows up and then bisecting between
+    # the last taken and the first free suffixes
+    free = 0
+    if taken(free):
+        last_taken, free = 0, 1
+        while taken(free):
+            if free >= MAX_BACKUPS:
+                raise Exception(f'Too many backup files for {file_name}')
+
+            last_taken, free = free, free * 2
+
+        while free - last_taken > 1:
+            middle = (last_taken + free) // 2
+            if taken(middle):
+                last_taken = middle
+            else:
+                free = middle
+
+    attempt = attempt_name(free)
+
+    # the caller is about to create it
+    existing.add(attempt)
 
     return os.path.join(dir_name, attempt)
 
 
+def walk_files(top: str) -> Iterator[Tuple[str, Sequence[str]]]:
+    """Walks a directory tree, top-down, with os.scandir
+
+    Yields, for every directory, its path relative to top ('' for top itself)
+    and the sorted names of the files it contains. As with os.walk, symlinks to
+    directories are neither followed nor reported as files, and directories
+    that can not be read are skipped
+    """
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+
+        files = []
+        sub_dirs = []
+        try:
+            with os.scandir(os.path.join(top, rel_dir)) as it:
+                for entry in it:
+                    if not entry.is_dir():
+                        files.append(entry.name)
+                    elif not entry.is_symlink():
+                        sub_dirs.append(entry.name)
+        except OSError:
+            continue
+
+        files.sort()
+        yield rel_dir, files
+
+        # reversed, so that sub directories are popped in name order
+        pending.extend(
+            os.path.join(rel_dir, sub_dir)
+            for sub_dir in sorted(sub_dirs, reverse=True))
+
+
+@functools.lru_cache(maxsize=64)
+def _package_contents(path: str, mtime_ns: int) -> Tuple[str, ...]:
+    # the files a '*' entry refers to, without the spec. mtime is only part of
+    # the cache key: adding, removing or renaming files changes the directory
+    # mtime, so that it is listed again
+    with os.scandir(path) as it:
+        return tuple(
+            sorted(
+                dir_entry.name for dir_entry in it
+                if dir_entry.name != SPEC_FILE_NAME))
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_relpath(path: str, start: str) -> str:
+    return os.path.relpath(path, start)
+
+
+def mk_link_target(source: str, dest_dir: str) -> str:
+    """Returns the path of source relative to dest_dir, to be used as the
+    target of a link created in dest_dir
+
+    Same as os.path.relpath(source, dest_dir). For absolute paths, the part
+    relative to the source's directory is cached, since links created by the
+    same package tend to share both source and destination directories
+    """
+    if not (os.path.isabs(source) and os.path.isabs(dest_dir)):
+        # relative paths depend on the cwd, can not be cached
+        return os.path.relpath(source, dest_dir)
+
+    source = os.path.normpath(source)
+    dest_dir = os.path.normpath(dest_dir)
+    if dest_dir == source or dest_dir.startswith(os.path.join(source, '')):
+        # linking to an ancestor: relpath walks up straight to the source
+        return os.path.relpath(source, dest_dir)
+
+    src_dir, name = os.path.split(source)
+    rel_dir = _cached_relpath(src_dir, dest_dir)
+
+    return name if rel_dir == os.curdir else os.path.join(rel_dir, name)
+
+
+def nested_destinations(destinations: Sequence[str]) -> bool:
+    """Tells whether a destination repeats or contains another destination
+
+    When that happens, the order in which the destinations are created matters
+    """
+    dests = {os.path.normpath(d) for d in destinations}
+    if len(dests) != len(destinations):
+        return True
+
+    # parents known to not be a destination
+    checked: set[str] = set()
+    for dest in dests:
+        d = os.path.dirname(dest)
+        while d not in checked:
+            if d in dests:
+                return True
+
+            checked.add(d)
+            d = os.path.dirname(d)
+
+    return False
+
+
 def mk_parent_dirs(dst: str):
     try:
         os.makedirs(os.path.dirname(dst))
@@ -78,6 +268,69 @@ def mk_parent_dirs(dst: str):
         pass
 
 
+# whether links can be created relative to a directory descriptor
+_LINK_DIR_FD = {os.stat, os.readlink, os.rename, os.symlink} <= \
+    os.supports_dir_fd
+# O_PATH descriptors do not need read permission on the directory
+_DIR_FD_FLAGS = getattr(os, 'O_PATH', os.O_RDONLY) | \
+    getattr(os, 'O_DIRECTORY', 0)
+
+
+def open_dir_fd(d: str) -> Optional[int]:
+    """Opens a descriptor for a directory
+
+    Returns None if the directory can not be opened, or on platforms where
+    links can not be created relative to a descriptor. The caller must close
+    the returned descriptor
+    """
+    if not _LINK_DIR_FD:
+        return None
+
+    try:
+        return os.open(d, _DIR_FD_FLAGS)
+    except OSError:
+        return None
+
+
+def materialize_all(actions: Sequence[BaseAction]) -> Sequence[BaseAction]:
+    """Materializes a sequence of actions
+
+    $HOME and the absolute path of every package are computed only once,
+    instead of once per action
+    """
+    home = os.path.expanduser('~')
+    cwd = os.getcwd()
+    pkg_abs_paths: dict[str, str] = {}
+
+    result = []
+    for action in actions:
+        try:
+            pkg_abs_path = pkg_abs_paths[action.package_path]
+        except KeyError:
+            # same as os.path.abspath, without asking for the cwd every time
+            pkg_abs_path = os.path.normpath(
+                os.path.join(cwd, action.package_path))
+            pkg_abs_paths[action.package_path] = pkg_abs_path
+
+        result.append(
+            action.materialize(home=home, pkg_abs_path=pkg_abs_path))
+
+    return result
+
+
+def execute_all(actions: Sequence[BaseAction]):
+    """Executes a sequence of actions in order
+
+    Consecutive actions of the same type are handed together to the type's
+    execute_batch, so that it can share work among them. Actions are never
+    reordered, since later actions may depend on earlier ones.
+    """
+    action_cls: Type[BaseAction]
+    for action_cls, batch in itertools.groupby(
+            actions, key=lambda action: type(action)):
+        action_cls.execute_batch(list(batch))
+
+
 # #######
 # Actions
 
@@ -85,7 +338,7 @@ def mk_parent_dirs(dst: str):
 TBaseAction = TypeVar('TBaseAction', bound='BaseAction')
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class BaseAction:
     """
     Base Action class.
@@ -101,7 +354,17 @@ class BaseAction:
         print('EXECUTING BASE for', type(self))
         raise Exception('not implemented')
 
-    def materialize(self: TBaseAction) -> TBaseAction:
+    @classmethod
+    def execute_batch(cls, actions: Sequence[BaseAction]):
+        """Executes a sequence of actions of this type, in order"""
+        for action in actions:
+            print(action.msg())
+            action.execute()
+
+    def materialize(
+            self: TBaseAction,
+            home: Optional[str] = None,
+            pkg_abs_path: Optional[str] = None) -> TBaseAction:
         """Returns a new action with the paths adjusted to package_path and
         $HOME
 
@@ -111,6 +374,9 @@ class BaseAction:
           reference adjusted to ~/src/dotfiles/dots/pkg1/file1
 
         - any destination path will be prefixed with ~/
+
+        home and pkg_abs_path may be given when materializing several actions
+        at once, see materialize_all
         """
         return self
 
@@ -127,7 +393,7 @@ class BaseAction:
 TSrcDestAction = TypeVar('TSrcDestAction', bound='SrcDestAction')
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SrcDestAction(BaseAction):
     """An action that has a source and a destination
 
@@ -153,29 +419,38 @@ class SrcDestAction(BaseAction):
                          dict[str,
                               str]]) -> Sequence[BaseAction]:
         if isinstance(entry, str):
+            if entry != '*':
+                # the most common entry: a single file linked to ~/.{file}
+                return [
+                    cls(
+                        package_path=package_path,
+                        source=entry,
+                        destination='.' + entry)
+                ]
+
             src = entry
-            dst = f'.{entry}'
+            dst = '.*'
         else:
             src = entry['from']
             dst = entry['to']
 
         if src == '*':
-            has_destination = dst != '.*'
-            package_contents = os.listdir(package_path)
+            package_contents = _package_contents(
+                os.path.abspath(package_path),
+                os.stat(package_path).st_mtime_ns)
 
-            def mk_dst(_path):
-                if has_destination:
-                    return os.path.join(dst, _path)
-                else:
-                    return f'.{_path}'
+            # without an explicit destination every file goes to ~/.{file},
+            # otherwise to {dst}/{file}. os.path.join(dst, '') ends dst with
+            # exactly one separator, so plain concatenation is enough per file
+            has_destination = dst != '.*'
+            dst_prefix = os.path.join(dst, '') if has_destination else '.'
 
             return [
                 cls(
                     package_path=package_path,
                     source=_file,
-                    destination=mk_dst(_file))
+                    destination=dst_prefix + _file)
                 for _file in package_contents
-                if _file != SPEC_FILE_NAME
             ]
 
         return [cls(package_path=package_path, source=src, destination=dst)]
@@ -189,40 +464,45 @@ class SrcDestAction(BaseAction):
         if isinstance(entries, str):
             entries = [entries]
 
-        return [
-            parsed for e in entries
-            for parsed in cls.parse_one_entry(package_path,
-                                              e)
-        ]
+        return list(
+            itertools.chain.from_iterable(
+                cls.parse_one_entry(package_path,
+                                    e) for e in entries))
 
-    def materialize(self: TSrcDestAction) -> TSrcDestAction:
+    def materialize(
+            self: TSrcDestAction,
+            home: Optional[str] = None,
+            pkg_abs_path: Optional[str] = None) -> TSrcDestAction:
         """
         Materialize the paths absolute
         """
 
-        dest_abs_path = os.path.expanduser(self.destination)
+        home = home or os.path.expanduser('~')
+
+        dest_abs_path = expand_home(self.destination, home)
         if not os.path.isabs(dest_abs_path):
-            dest_abs_path = os.path.join(Path.home(), dest_abs_path)
+            dest_abs_path = os.path.join(home, dest_abs_path)
 
         # dest_dirname = os.path.dirname(os.path.expanduser(dest_abs_path))
 
         if self.source_is_local:
-            src_abs_path = os.path.expanduser(self.source)
+            src_abs_path = expand_home(self.source, home)
             if not os.path.isabs(src_abs_path):
-                pkg_abs_path = os.path.abspath(self.package_path)
+                pkg_abs_path = pkg_abs_path or os.path.abspath(
+                    self.package_path)
                 src_abs_path = os.path.join(pkg_abs_path, src_abs_path)
         else:
             src_abs_path = self.source
 
         return type(self)(
-            package_path=str(Path.home()),
+            package_path=home,
             source=src_abs_path,
             destination=dest_abs_path,
             source_is_local=self.source_is_local)
 
 
 @action('link')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SymlinkAction(SrcDestAction):
     """Symlinks a file or directory to a destination
 
@@ -245,31 +525,156 @@ class SymlinkAction(SrcDestAction):
         return f'SYMLINK {self.destination} -> {self.source}'
 
     def execute(self):
+        mk_parent_dirs(self.destination)
+        for line in self._symlink():
+            print(line)
+
+    @classmethod
+    def execute_batch(cls, actions: Sequence[BaseAction]):
+        links: Sequence[SymlinkAction] = actions  # type: ignore
+
+        # links that are not created inside or over one another do not depend
+        # on each other, so they are created in parallel, overlapping the
+        # filesystem calls. Output is still printed in order
+        parallel = len(links) >= SYMLINK_BATCH_MIN and \
+            not nested_destinations([link.destination for link in links])
+
+        # consecutive links to the same directory are linked relative to a
+        # descriptor of it, so that the kernel does not resolve the whole
+        # destination path for every call. The directory is opened only while
+        # its links are created, so at most one descriptor per worker is open
+        groups = [
+            list(group) for _, group in itertools.groupby(
+                links, key=lambda link: os.path.dirname(link.destination))
+        ]
+
+        # index of the first group that failed. Groups after it change
+        # nothing once they see it
+        failed_at = len(groups)
+        failed_lock = threading.Lock()
+
+        def link_group(
+                index: int, group: Sequence[SymlinkAction]
+        ) -> Tuple[list[Sequence[str]], Optional[Exception]]:
+            # returns the output of every link created, and the error that
+            # stopped the group, if any
+            nonlocal failed_at
+            created: list[Sequence[str]] = []
+            if index > failed_at:
+                return created, None
+
+            dir_fd = None
+            try:
+                # the directory is created right before its links, since an
+                # earlier link may be created where it would be
+                dest_dir = os.path.dirname(group[0].destination)
+                os.makedirs(dest_dir, exist_ok=True)
+
+                dir_fd = open_dir_fd(dest_dir)
+                for link in group:
+                    if index > failed_at:
+                        break
+
+                    created.append(link._symlink(dir_fd))
+            except Exception as e:
+                with failed_lock:
+                    failed_at = min(failed_at, index)
+
+                return created, e
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+
+            return created, None
+
+        with ThreadPoolExecutor(max_workers=SYMLINK_WORKERS) as executor:
+            if parallel:
+                futures = [
+                    executor.submit(link_group, index, group)
+                    for index, group in enumerate(groups)
+                ]
+                results = (
+                    (group, future.result())
+                    for group, future in zip(groups, futures)
+                    if not future.cancelled())
+            else:
+                futures = []
+                results = (
+                    (group, link_group(index, group))
+                    for index, group in enumerate(groups))
+
+            # after a failure, groups that were already running may still have
+            # linked something, and that is shown as well
+            first_error = None
+            for group, (created, error) in results:
+                for link, lines in zip(group, created):
+                    print(link.msg())
+                    for line in lines:
+                        print(line)
+
+                if error is None:
+                    continue
+
+                # the link that failed is still shown
+                print(group[len(created)].msg())
+                if first_error is None:
+                    first_error = error
+                    for future in futures:
+                        future.cancel()
+
+            if first_error is not None:
+                raise first_error
+
+    def _symlink(self, dir_fd: Optional[int] = None) -> Sequence[str]:
+        # expects the parent directory of the destination to exist
+        #
+        # returns the lines to be shown, so that links created by several
+        # threads do not mix their outputs
+        #
+        # when dir_fd is given, it must be a descriptor of the destination's
+        # directory
 
         # We want relative link paths. If we're going to link ~/.a/b/c to
         # ~/src/dots/pkg/c , then the link must poing to ../../src/dots/pkg/c
         dest_dir = os.path.dirname(self.destination)
-        link_target = os.path.relpath(self.source, dest_dir)
+        link_target = mk_link_target(self.source, dest_dir)
 
-        if os.path.lexists(self.destination):
+        dest = self.destination
+        if dir_fd is not None:
+            dest = os.path.basename(dest)
+
+        # a single lstat tells whether the destination exists and if it's a
+        # link
+        try:
+            dest_stat = os.lstat(dest, dir_fd=dir_fd)
+        except FileNotFoundError:
+            dest_stat = None
+
+        if dest_stat is not None:
             # if it's a link pointing to the same path as we want to link
             # there's nothing to do
-            if os.path.islink(self.destination) and \
-               os.readlink(self.destination) == link_target:
-                print('LINK ALREADY IN PLACE -- SKIPPING')
-                return
+            if stat.S_ISLNK(dest_stat.st_mode) and \
+               os.readlink(dest, dir_fd=dir_fd) == link_target:
+                return ['LINK ALREADY IN PLACE -- SKIPPING']
 
+            # backups are always created next to the destination
             new_name = mk_backup_name(self.destination)
-            print('BACKUP', self.destination, 'TO', new_name)
+            os.rename(
+                dest,
+                new_name if dir_fd is None else os.path.basename(new_name),
+                src_dir_fd=dir_fd,
+                dst_dir_fd=dir_fd)
+            os.symlink(link_target, dest, dir_fd=dir_fd)
 
-            os.rename(self.destination, new_name)
+            return [f'BACKUP {self.destination} TO {new_name}']
 
-        mk_parent_dirs(self.destination)
-        os.symlink(link_target, self.destination)
+        os.symlink(link_target, dest, dir_fd=dir_fd)
+
+        return []
 
 
 @action('copy_once')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CopyOnceAction(SrcDestAction):
     """Copies a file or directory to a destination only if if does not
     already exists
@@ -293,7 +698,9 @@ class CopyOnceAction(SrcDestAction):
         return f'COPY ONCE TO {self.destination} FROM {self.source}'
 
     def execute(self):
-        if not os.path.exists(self.destination):
+        # lexists: a dangling link at the destination must not be copied
+        # through
+        if not os.path.lexists(self.destination):
             mk_parent_dirs(self.destination)
             shutil.copy(self.source, self.destination)
         else:
@@ -301,7 +708,7 @@ class CopyOnceAction(SrcDestAction):
 
 
 @action('copy')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class CopyAction(SrcDestAction):
     """Copies a file or directory to a destination
 
@@ -338,7 +745,7 @@ class CopyAction(SrcDestAction):
 
 
 @action('mkdir')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class MkdirAction(BaseAction):
     """Creates a directory tree
 
@@ -357,24 +764,30 @@ class MkdirAction(BaseAction):
     def msg(self):
         return f'MKDIR {self.target_dir}'
 
-    def materialize(self) -> MkdirAction:
-        path = os.path.expanduser(self.target_dir)
+    def materialize(
+            self,
+            home: Optional[str] = None,
+            pkg_abs_path: Optional[str] = None) -> MkdirAction:
+        home = home or os.path.expanduser('~')
+
+        path = expand_home(self.target_dir, home)
         if not os.path.isabs(path):
-            path = os.path.join('~', self.target_dir)
+            path = os.path.join(home, path)
 
-        return MkdirAction(package_path=str(Path.home()), target_dir=path)
+        return MkdirAction(package_path=home, target_dir=path)
 
     def execute(self):
         target = os.path.expanduser(self.target_dir)
         if not os.path.isabs(target):
-            target = os.path.join(Path.home(), target)
+            target = os.path.join(os.path.expanduser('~'), target)
 
-        if os.path.lexists(target):
+        try:
+            os.makedirs(target, exist_ok=True)
+        except FileExistsError:
+            # exist_ok only covers existing directories
             if not os.path.isdir(target):
                 raise Exception(
                     f'can not create path {target}: it exists as a file')
-        else:
-            os.makedirs(target)
 
     @classmethod
     def parse_entries(
@@ -385,14 +798,12 @@ class MkdirAction(BaseAction):
         if isinstance(entries, str):
             entries = [entries]
 
-        return [
-            MkdirAction(str(Path.home()),
-                        target_dir=entry) for entry in entries
-        ]
+        home = os.path.expanduser('~')
+        return [MkdirAction(home, target_dir=entry) for entry in entries]
 
 
 @action('link_recursively')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class SymlinkRecursiveAction(SrcDestAction):
     """Symlinks all files, recursively
 
@@ -441,24 +852,30 @@ class SymlinkRecursiveAction(SrcDestAction):
         actions = []
         recurse_origin = os.path.join(self.package_path, self.source)
 
-        for root, _dirs, files in os.walk(recurse_origin):
-
-            link_src_dir = os.path.relpath(root, recurse_origin)
+        def dir_prefix(path):
+            # normalized directory, ending with a separator, to which bare file
+            # names are concatenated; the current directory becomes '' so that
+            # no './' prefix is added
+            path = os.path.normpath(path)
+            return '' if path == '.' else os.path.join(path, '')
+
+        # only the spec provided paths need normalization, the relative dirs
+        # yielded by walk_files are already clean
+        src_base = dir_prefix(self.source)
+        dst_base = dir_prefix(self.destination)
+
+        for link_src_dir, files in walk_files(recurse_origin):
+            # every file in the directory shares the same source and
+            # destination prefixes
+            sub_dir = os.path.join(link_src_dir, '') if link_src_dir else ''
+            src_prefix = src_base + sub_dir
+            dst_prefix = dst_base + sub_dir
 
             for file_name in files:
-                src_file = os.path.join(self.source, link_src_dir, file_name)
-                src_file = os.path.normpath(src_file)
-
-                dst_path = os.path.normpath(
-                    os.path.join(self.destination,
-                                 link_src_dir))
-
-                dst = os.path.join(dst_path, file_name)
-
                 link_action = SymlinkAction(
                     package_path=self.package_path,
-                    source=src_file,
-                    destination=dst)
+                    source=src_prefix + file_name,
+                    destination=dst_prefix + file_name)
 
                 actions.append(link_action)
 
@@ -471,7 +888,11 @@ class SymlinkRecursiveAction(SrcDestAction):
             entries: Union[str, Sequence[Any]]
     ) -> Sequence[BaseAction]:
 
-        actions = super().parse_entries(package_path, entries)
+        # slots dataclasses are re-created by the decorator, so the implicit
+        # __class__ cell used by a bare super() points to the wrong class
+        actions = super(SymlinkRecursiveAction, cls).parse_entries(
+            package_path,
+            entries)
 
         def action_yielder():
             for action in actions:
@@ -485,7 +906,7 @@ class SymlinkRecursiveAction(SrcDestAction):
 
 
 @action('git_clone')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitCloneAction(SrcDestAction):
     """Clones a git repository
 
@@ -544,12 +965,13 @@ class GitCloneAction(SrcDestAction):
             raise InvalidActionDescription(
                 'git_clone requires a dict with fields url and to')
         else:
-            try:
-                src = entry['url']
-                dst = entry['to']
-            except KeyError as e:
-                raise InvalidActionDescription(
-                    f'Missing gitclone field {e.args[0]}')
+            src = entry.get('url')
+            dst = entry.get('to')
+
+            if src is None:
+                raise InvalidActionDescription('Missing gitclone field url')
+            if dst is None:
+                raise InvalidActionDescription('Missing gitclone field to')
 
             branch = entry.get('branch')
 
@@ -562,7 +984,109 @@ class GitCloneAction(SrcDestAction):
                     source_is_local=False)
             ]
 
+    def _git(
+            self,
+            *args: str,
+            check: bool = True,
+            log: Optional[Callable[[str], Any]] = None) -> str:
+        """Runs a git command on the destination repo, returning its output
+
+        Without log, git runs attached to the terminal and may prompt for
+        credentials. With it, git can not prompt, and its error output is sent
+        to log, so that several repos can be synced at once
+        """
+        kwargs: dict[str, Any] = {}
+        if log is not None:
+            kwargs = dict(
+                stdin=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'})
+
+        result = subprocess.run(
+            ['git', *args],
+            cwd=self.destination,
+            stdout=subprocess.PIPE,
+            text=True,
+            **kwargs)
+
+        if log is not None:
+            for line in result.stderr.splitlines():
+                log(line)
+
+        if check:
+            result.check_returncode()
+
+        return result.stdout.strip() if result.returncode == 0 else ''
+
+    def _rev_parse(
+            self,
+            ref: str,
+            log: Optional[Callable[[str], Any]] = None) -> Optional[str]:
+        """Returns the commit a ref points to, or None if it does not exist"""
+        sha = self._git(
+            'rev-parse', '--verify', '--quiet', ref, check=False, log=log)
+        return sha or None
+
     def execute(self):
+        self._sync(print)
+
+    @classmethod
+    def execute_batch(cls, actions: Sequence[BaseAction]):
+        # clones are network bound and independent from each other, unless a
+        # repo is cloned inside another one, so they run in parallel. The
+        # progress of each clone is collected and shown in order
+        clones: Sequence[GitCloneAction] = actions  # type: ignore
+        if len(clones) < 2 or nested_destinations(
+                [clone.destination for clone in clones]):
+            super(GitCloneAction, cls).execute_batch(clones)
+            return
+
+        def sync(
+                clone: GitCloneAction
+        ) -> Tuple[Sequence[str], Optional[Exception]]:
+            # returns the progress of the clone, and the error that stopped
+            # it, if any
+            lines: list[str] = []
+            try:
+                clone._sync(lines.append, interactive=False)
+            except Exception as e:
+                return lines, e
+
+            return lines, None
+
+        with ThreadPoolExecutor(max_workers=GIT_CLONE_WORKERS) as executor:
+            futures = [executor.submit(sync, clone) for clone in clones]
+
+            # clones that were already running when one failed are still
+            # synced, and shown
+            first_error = None
+            for clone, future in zip(clones, futures):
+                if future.cancelled():
+                    continue
+
+                lines, error = future.result()
+                print(clone.msg())
+                for line in lines:
+                    print(line)
+
+                if error is not None and first_error is None:
+                    first_error = error
+                    for pending in futures:
+                        pending.cancel()
+
+            if first_error is not None:
+                raise first_error
+
+    def _sync(self, log: Callable[[str], Any], interactive: bool = True):
+        """Clones or updates the repo, reporting progress through log
+
+        When not interactive, git can not prompt and its errors are reported
+        through log as well
+        """
+        git_log = None if interactive else log
+        git = functools.partial(self._git, log=git_log)
+        rev_parse = functools.partial(self._rev_parse, log=git_log)
+
         if os.path.isfile(self.destination):
             raise Exception(
                 f"Can not initialize a git repo at {self.destination}: "
@@ -570,67 +1094,102 @@ class GitCloneAction(SrcDestAction):
             )
 
         # create or load the repo
-        try:
-            repo = Repo(self.destination)
-        except Exception:
-            print(f'- Initialize repo at {self.destination}')
-            repo = Repo.init(self.destination)
-            repo.create_remote('origin', self.source)
-
-        if not len(repo.remotes):
-            # bare repo, use origin
-            dot_remote = repo.create_remote('origin', self.source)
-        else:
-            # find remote by url or create one
-            try:
-                dot_remote = next(
-                    remote for remote in repo.remotes
-                    if remote.url == self.source)
-            except Exception:
-                print(f'- Add remote {self.source}')
-                dot_remote = repo.create_remote('from_dot_setup', self.source)
-
-        print('- Fetching changes')
-        dot_remote.fetch()
+        if not os.path.isdir(os.path.join(self.destination, '.git')):
+            log(f'- Initialize repo at {self.destination}')
+            os.makedirs(self.destination, exist_ok=True)
+            git('init', '--quiet')
+
+        # find remote by url or create one. A repo without remotes gets it as
+        # origin
+        remotes = git('remote').split()
+        dot_remote = next(
+            (
+                remote for remote in remotes
+                if git('remote', 'get-url', remote) == self.source),
+            None)
+
+        if dot_remote is None:
+            if remotes:
+                log(f'- Add remote {self.source}')
+                dot_remote = 'from_dot_setup'
+            else:
+                dot_remote = 'origin'
+
+            git('remote', 'add', dot_remote, self.source)
+
+        log('- Fetching changes')
+        git('fetch', '--quiet', dot_remote)
+
+        # empty on a detached head
+        current_branch = git(
+            'symbolic-ref',
+            '--quiet',
+            '--short',
+            'HEAD',
+            check=False)
 
         # find by branch name
         if self.branch:
             branch_names = [self.branch]
         else:
-            branch_names = [repo.head.ref.name, 'main', 'master']
-
-        remote_head = None
-        local_head = None
+            # the current branch may be one of the defaults
+            branch_names = list(dict.fromkeys(
+                name for name in (current_branch, 'main', 'master') if name))
 
         for branch_name in branch_names:
             # locate the remote head
             # skip if not found
-            try:
-                remote_head = dot_remote.refs[branch_name]
-            except Exception:
+            remote_ref = f'{dot_remote}/{branch_name}'
+            remote_sha = rev_parse(f'refs/remotes/{remote_ref}')
+            if remote_sha is None:
                 continue
 
-            # locate or create local head and set it to track the remote head
-            try:
-                local_head = repo.refs[branch_name]
-            except Exception:
-                remote_head.checkout()
-                local_head = repo.create_head(f'refs/heads/{branch_name}')
+            # locate or create local head at the remote head
+            local_sha = rev_parse(f'refs/heads/{branch_name}')
+            if local_sha is None:
+                log(f'- Checking out ref {branch_name}')
+                git('checkout', '--quiet', '-b', branch_name, remote_ref)
+                current_branch = branch_name
+                local_sha = remote_sha
 
             # found both heads
             break
+        else:
+            raise Exception(
+                f'Remote {self.source} has none of the branches '
+                f'{", ".join(branch_names)}')
+
+        git(
+            'branch',
+            '--quiet',
+            f'--set-upstream-to={remote_ref}',
+            branch_name)
+
+        # already on the branch and at the fetched commit, checking it out
+        # again and pulling would be a no-op
+        if current_branch == branch_name and local_sha == remote_sha:
+            log(f'- Ref {branch_name} is up to date')
+            return
+
+        log(f'- Checking out ref {branch_name}')
+        git('checkout', '--quiet', branch_name)
 
-        local_head.set_tracking_branch(remote_head)
+        log('- Pulling changes from remote')
+        git('pull', '--quiet', dot_remote, branch_name)
 
-        print(f'- Checking out ref {local_head.name}')
-        local_head.checkout()
 
-        print('- Pulling changes from remote')
-        dot_remote.pull()
+def _run_script(script: str, cwd: Optional[str] = None) -> int:
+    # the script is read from a file: arguments are limited in size, and the
+    # commands keep the terminal as their stdin (e.g. `read`)
+    with tempfile.NamedTemporaryFile('w', suffix='.sh') as fh:
+        fh.write(script)
+        fh.flush()
+
+        return subprocess.run(['sh', fh.name], cwd=cwd).returncode
 
 
 @action('execute')
-@dataclass
+@dataclass(frozen=True, slots=True)
 class ExecuteAction(BaseAction):
     """Executes commands under a new shell
 
@@ -682,31 +1241,45 @@ class ExecuteAction(BaseAction):
 
         return '\n'.join(lines)
 
-    def execute(self):
+    def _script(self) -> str:
+        # the exit status of every item is checked, stopping the script at
+        # the first item that fails
+        fail_guard = (
+            '\n[ $? = 0 ] || '
+            '{ echo Failed to execute last command; exit 1; }\n')
 
-        def fail_guard_generator():
-            for cmd in self.cmds:
-                yield cmd
-                yield '''
-                if [ $? != 0 ] ; then
-                    echo Failed to execute last command ;
-                    exit 1;
-                fi
-                '''
+        return fail_guard.join(self.cmds) + fail_guard
 
-        cmds = fail_guard_generator()
+    def execute(self):
+        # the shell runs on the package path, without changing the cwd of
+        # this process
+        returncode = _run_script(
+            self._script(), cwd=os.path.abspath(self.package_path))
 
-        cur_dir = os.getcwd()
-        try:
-            os.chdir(os.path.abspath(self.package_path))
-            script = '\n'.join(cmds)
-            input = script.encode('utf-8')
-            result = subprocess.run(['sh'], input=input)
-
-            if result.returncode != 0:
-                raise Exception('Failed during execute action')
-        finally:
-            os.chdir(cur_dir)
+        if returncode != 0:
+            raise Exception('Failed during execute action')
+
+    @classmethod
+    def execute_batch(cls, actions: Sequence[BaseAction]):
+        # consecutive execute rules share a single shell process. Every rule
+        # still runs in its own sub shell, on its own package path, so rules
+        # do not see each other's variables or working directory
+        execs: Sequence[ExecuteAction] = actions  # type: ignore
+        if len(execs) == 1:
+            print(execs[0].msg())
+            execs[0].execute()
+            return
+
+        script = ''.join(
+            f"printf '%s\\n' {shlex.quote(e.msg())}\n"
+            f"(\ncd {shlex.quote(os.path.abspath(e.package_path))} || exit 1\n"
+            f"{e._script()}) || exit 1\n" for e in execs)
+
+        # the shell writes to the same terminal, anything printed so far must
+        # show up before it
+        sys.stdout.flush()
+        if _run_script(script) != 0:
+            raise Exception('Failed during execute action')
 
     @classmethod
     def parse_entries(
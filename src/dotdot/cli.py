@@ -3,14 +3,16 @@ import sys
 import textwrap
 from argparse import ArgumentParser
 
-from yaml.error import YAMLError
-
-from dotdot.actions import get_actions_help
+from dotdot.actions import execute_all, get_actions_help, materialize_all
 from dotdot.exceptions import InvalidActionType, InvalidPackageException
 from dotdot.pkg import Package
+from dotdot.spec_cache import SpecCache
 
 
 def exception_to_msg(ex: Exception) -> str:
+    # yaml is imported lazily when loading specs
+    from yaml.error import YAMLError
+
     if isinstance(ex, InvalidPackageException):
         return 'path contains an invalid dot'
     elif isinstance(ex, YAMLError):
@@ -26,7 +28,12 @@ def cmd_list(args):
         print('Invalid dots path', args.dots_path)
         sys.exit(1)
 
-    pkgs, errors = Package.scan(args.dots_path)
+    # every action entry is still parsed, so that invalid entries are
+    # reported. specs that did not change since the last list are not parsed
+    # again, though
+    spec_cache = SpecCache.load()
+    pkgs, errors = Package.scan(args.dots_path, spec_cache=spec_cache)
+    spec_cache.save()
 
     if errors:
         print('Warning: Errors found on the following dots:')
@@ -57,14 +64,11 @@ def cmd_install(args):
 
     for pkg in pkgs:
         print(f'Installing {pkg.name}')
-        for action in pkg.actions:
-            try:
-                action = action.materialize()
-                print(action.msg())
-                action.execute()
-            except Exception as e:
-                print('Error while executing action:', str(e))
-                return
+        try:
+            execute_all(materialize_all(pkg.actions))
+        except Exception as e:
+            print('Error while executing action:', str(e))
+            return
 
 
 def cmd_show(args):
@@ -87,8 +91,7 @@ def cmd_show(args):
     print('Variants:', ', '.join(variant_names))
 
     print('Actions:')
-    for action in pkg.actions:
-        action = action.materialize()
+    for action in materialize_all(pkg.actions):
         print(action.msg())
 
 
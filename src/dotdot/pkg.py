@@ -1,15 +1,25 @@
 from __future__ import annotations
 
+import collections.abc
+import functools
 import os
 import os.path
+import stat
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional, Sequence, Set, Tuple
-
-import yaml
+from typing import (
+    Callable,
+    Iterator,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union)
 
 from dotdot.actions import BaseAction, SymlinkAction, action_class_from_str
 from dotdot.exceptions import InvalidPackageException
 from dotdot.spec import SPEC_FILE_NAME
+from dotdot.spec_cache import SpecCache
 
 
 DOTS_TO_IGNORE = {
@@ -17,6 +27,60 @@ DOTS_TO_IGNORE = {
 }
 
 
+@functools.lru_cache(maxsize=256)
+def _load_spec(path: str, mtime_ns: int, size: int) -> dict:
+    # mtime and size are only part of the cache key, so that a spec file that
+    # changed on disk is parsed again
+    #
+    # the whole file is handed to the loader as bytes: libyaml decodes utf-8
+    # itself and scans a single buffer instead of reading the file in chunks
+    with open(path, 'rb') as fh:
+        raw = fh.read()
+
+    # yaml is only imported when a spec is actually found, dots without specs
+    # never pay for it
+    import yaml
+
+    # prefer the libyaml backed loader, falling back to the pure python one
+    # when pyyaml has been built without it
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+    return yaml.load(raw, Loader=loader)
+
+
+class LazyActions(collections.abc.Sequence):
+    """A sequence of actions that is only built when first accessed"""
+
+    def __init__(self, loader: Callable[[], Sequence[BaseAction]]):
+        self._loader: Optional[Callable[[], Sequence[BaseAction]]] = loader
+        self._actions: Sequence[BaseAction] = []
+
+    def _load(self) -> Sequence[BaseAction]:
+        if self._loader is not None:
+            self._actions = self._loader()
+            self._loader = None
+
+        return self._actions
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        if self._loader is not None:
+            return 'LazyActions(<not loaded>)'
+
+        return f'LazyActions({self._actions!r})'
+
+
 @dataclass
 class Package:
     name: str
@@ -30,34 +94,31 @@ class Package:
         # The most simple type of dot: the path is the file or folder that must
         # be symlinked to the home path
 
-        base_name = os.path.basename(path)
-        package_path = os.path.dirname(path)
-        dest = f'.{base_name}'
-
-        actions = [
-            SymlinkAction(
-                package_path=package_path,
-                source=base_name,
-                destination=dest)
-        ]
+        package_path, base_name = os.path.split(path)
 
         return Package(
             base_name,
             None,
             package_path,
             variants={'default'},
-            actions=actions)
+            actions=[
+                SymlinkAction(
+                    package_path=package_path,
+                    source=base_name,
+                    destination='.' + base_name)
+            ])
 
     @staticmethod
-    def _from_dot_directory(path: str) -> Package:
+    def _from_dot_directory(path: str, sources: Sequence[str]) -> Package:
         # a bunch of files or folders that must be symlinked
         base_name = os.path.basename(path)
 
-        actions = []
-        for source in os.listdir(path):
-            dest = f'.{source}'
-
-            actions.append(SymlinkAction(source, dest))
+        actions = [
+            SymlinkAction(
+                package_path=path,
+                source=source,
+                destination='.' + source) for source in sources
+        ]
 
         return Package(
             base_name,
@@ -67,106 +128,203 @@ class Package:
             actions=actions)
 
     @staticmethod
-    def from_dot_path(path: str, variant: Optional[str] = None) -> Package:
-
-        # default variant is always default
-        variant = variant or 'default'
+    def _from_spec_file(
+            path: str,
+            metadata_file: str,
+            variant: str,
+            lazy: bool = False,
+            spec_cache: Optional[SpecCache] = None) -> Package:
+        dot_name = os.path.basename(path)
+
+        # parse a yaml containing the name and actions to be performed
+        st = os.stat(metadata_file)
+        spec_path = os.path.abspath(metadata_file)
+
+        data = None
+        if spec_cache is not None:
+            data = spec_cache.get(spec_path, st.st_mtime_ns, st.st_size)
+
+        if data is None:
+            data = _load_spec(spec_path, st.st_mtime_ns, st.st_size)
+            if spec_cache is not None:
+                spec_cache.put(spec_path, st.st_mtime_ns, st.st_size, data)
+
+        description = data.get('description') or os.path.basename(path)
+
+        # check for variants. if the key does not exist, create a default
+        # variant from the actions entry
+        variants = data.get('variants')
+        variants = variants or {'default': data.get('actions', [])}
+
+        try:
+            actions_list = variants[variant]
+        except KeyError:
+            raise InvalidPackageException(
+                f"Package {dot_name} does not contain a variant ' \
+                'named `{variant}\'"
+            )
+
+        # flatten the action list, in case we have nested actions list. an
+        # explicit stack of iterators avoids one generator per nesting level
+        def action_iterator(actions):
+            stack = [iter(actions)]
+            while stack:
+                for action in stack[-1]:
+                    if isinstance(action, list):
+                        stack.append(iter(action))
+                        break
+
+                    yield action
+                else:
+                    stack.pop()
+
+        # input_actions_list is a list of dictionaries
+        # dictionary can be a simple entry
+        #    ex. {"link": "some_file"}
+        # a list of text entries
+        #    ex. {"link": ["file1", "file2"]}
+        # a list of dictionary entries
+        #    ex {"link": [
+        #                 {"from": "source_path", "to": "dst_path"},
+        #                 {"from": "source_path", "to": "dst_path"},
+        #                ]
+        #       }
+        #
+        # action types are always resolved here, so that invalid specs are
+        # reported even when the entries themselves are parsed lazily
+        action_entries = [
+            (action_class_from_str(key), entry)
+            for action_input_dict in action_iterator(actions_list)
+            for key, entry in action_input_dict.items()
+        ]
 
-        metadata_file = os.path.join(path, SPEC_FILE_NAME)
-        if os.path.isfile(metadata_file):
+        def parse_actions():
+            output_actions = []
+            for action_class, entry in action_entries:
+                # parse_entries already lifts a single str entry to a list
+                output_actions.extend(action_class.parse_entries(path, entry))
 
-            dot_name = os.path.basename(path)
+            return output_actions
 
-            # parse a yaml containing the name and actions to be performed
-            with open(metadata_file, 'r') as fh:
-                data: dict = yaml.safe_load(fh)
+        return Package(
+            dot_name,
+            description,
+            path,
+            variants=set(variants.keys()),
+            actions=LazyActions(parse_actions) if lazy else parse_actions())
 
-            description = data.get('description') or os.path.basename(path)
+    @staticmethod
+    def from_dot_path(
+            path: Union[str, os.DirEntry],
+            variant: Optional[str] = None,
+            lazy: bool = False,
+            spec_cache: Optional[SpecCache] = None) -> Package:
+        """Loads a package from a path
 
-            # check for variants. if the key does not exist, create a default
-            # variant from the actions entry
-            variants = data.get('variants')
-            variants = variants or {'default': data.get('actions', [])}
+        path may also be a DirEntry obtained from os.scandir, in which case
+        the file type cached in the entry is used instead of stat'ing the path
+        again
 
-            try:
-                actions_list = variants[variant]
-            except KeyError:
-                raise InvalidPackageException(
-                    f"Package {dot_name} does not contain a variant ' \
-                    'named `{variant}\'"
-                )
-
-            # flatten the action list, in case we have nested actions list
-            def action_iterator(actions):
-                for action in actions:
-                    if isinstance(action, list):
-                        yield from action_iterator(action)
-                    else:
-                        yield action
+        When lazy is set, the entries of a spec file are only parsed into
+        actions when the package actions are first accessed. Invalid entries
+        are only reported then, too.
 
-            output_actions = []
+        When a spec_cache is given, specs found there are not parsed again.
+        """
 
-            # input_actions_list is a list of dictionaries
-            # dictionary can be a simple entry
-            #    ex. {"link": "some_file"}
-            # a list of text entries
-            #    ex. {"link": ["file1", "file2"]}
-            # a list of dictionary entries
-            #    ex {"link": [
-            #                 {"from": "source_path", "to": "dst_path"},
-            #                 {"from": "source_path", "to": "dst_path"},
-            #                ]
-            #       }
-            for action_input_dict in action_iterator(actions_list):
-                for key, entry in action_input_dict.items():
-                    # lift entry to normalize it as a list
-                    if isinstance(entry, str):
-                        entry = [entry]
-
-                    action_class = action_class_from_str(key)
-                    entries = action_class.parse_entries(path, entry)
-                    output_actions.extend(entries)
-
-            return Package(
-                dot_name,
-                description,
-                path,
-                variants=set(variants.keys()),
-                actions=output_actions)
+        # default variant is always default
+        variant = variant or 'default'
 
+        if isinstance(path, os.DirEntry):
+            is_file = path.is_file()
+            is_dir = not is_file and path.is_dir()
+            dot_path = path.path
         else:
+            dot_path = path
+
+            # a single stat answers both isfile and isdir
+            try:
+                mode = os.stat(dot_path).st_mode
+            except (OSError, ValueError):
+                mode = 0
+
+            is_file = stat.S_ISREG(mode)
+            is_dir = stat.S_ISDIR(mode)
+
+        if is_file:
             # simple file, link it to home
-            if os.path.isfile(path):
-                return Package._from_dot_file(path)
-                # folder without spec, link all files
-            elif os.path.isdir(path):
-                return Package._from_dot_directory(path)
-            else:
-                raise InvalidPackageException(
-                    f'path {path} does not contain a valid package')
+            return Package._from_dot_file(dot_path)
+        elif is_dir:
+            # a single readdir tells whether there's a spec and, if there's
+            # none, which files must be linked
+            with os.scandir(dot_path) as it:
+                children = {entry.name: entry for entry in it}
+
+            spec_entry = children.get(SPEC_FILE_NAME)
+            if spec_entry is not None and spec_entry.is_file():
+                return Package._from_spec_file(
+                    dot_path,
+                    spec_entry.path,
+                    variant,
+                    lazy,
+                    spec_cache)
+
+            # folder without spec, link all files
+            return Package._from_dot_directory(dot_path, sorted(children))
+        else:
+            raise InvalidPackageException(
+                f'path {dot_path} does not contain a valid package')
 
     @staticmethod
-    def scan(
-            path: str) -> Tuple[Sequence[Package],
-                                Sequence[Tuple[str,
-                                               Exception]]]:
-        """Scans a path for dots and """
+    def iter_scan(
+        path: str,
+        lazy: bool = False,
+        spec_cache: Optional[SpecCache] = None
+    ) -> Iterator[Tuple[str, Union[Package, Exception]]]:
+        """Scans a path for dots, yielding them one at a time
+
+        Yields tuples of (dot name, package), or (dot name, exception) for the
+        dots that could not be loaded
+        """
 
         if not os.path.isdir(path):
             raise FileNotFoundError(f'Dots path {path} does not exists')
 
-        contents = os.listdir(path)
+        with os.scandir(path) as it:
+            contents = sorted(
+                (entry for entry in it if entry.name not in DOTS_TO_IGNORE),
+                key=lambda entry: entry.name)
 
-        results = []
-        errors = []
-        for dot in contents:
-            if dot in DOTS_TO_IGNORE:
-                continue
-
-            dot_path = os.path.join(path, dot)
+        def load(dot: os.DirEntry) -> Union[Package, Exception]:
             try:
-                results.append(Package.from_dot_path(dot_path))
+                return Package.from_dot_path(
+                    dot, lazy=lazy, spec_cache=spec_cache)
             except Exception as e:
-                errors.append((dot, e))
+                return e
+
+        # loading a dot is mostly waiting on the filesystem, so dots are loaded
+        # in parallel. map still yields them in the order they were listed
+        max_workers = min(16, (os.cpu_count() or 4) * 2)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for dot, result in zip(contents, executor.map(load, contents)):
+                yield dot.name, result
+
+    @staticmethod
+    def scan(
+        path: str,
+        lazy: bool = False,
+        spec_cache: Optional[SpecCache] = None
+    ) -> Tuple[Sequence[Package], Sequence[Tuple[str, Exception]]]:
+        """Scans a path for dots and returns the packages and the errors found
+        """
+
+        results = []
+        errors = []
+        for dot, result in Package.iter_scan(
+                path, lazy=lazy, spec_cache=spec_cache):
+            if isinstance(result, Exception):
+                errors.append((dot, result))
+            else:
+                results.append(result)
 
         return results, errors
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import os
+import os.path
+import threading
+from typing import Optional
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+
+    return os.path.join(cache_home, 'dotdot', 'specs.json')
+
+
+class SpecCache:
+    """Parsed spec files, persisted between runs as json
+
+    Entries are keyed by the absolute path of the spec and are only valid
+    while the file's mtime and size do not change. The cache is best effort:
+    an unreadable cache file starts an empty cache, and failing to save it is
+    not an error
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: dict = {}
+        self._dirty = False
+        # scan loads dots from several threads
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> SpecCache:
+        cache = cls(path or default_cache_path())
+        try:
+            with open(cache.path, 'rb') as fh:
+                entries = json.load(fh)
+        except (OSError, ValueError):
+            entries = None
+
+        if isinstance(entries, dict):
+            cache._entries = entries
+
+        return cache
+
+    def get(self, spec_path: str, mtime_ns: int, size: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(spec_path)
+
+        if isinstance(entry, dict) and \
+           entry.get('mtime_ns') == mtime_ns and \
+           entry.get('size') == size:
+            return entry.get('data')
+
+        return None
+
+    def put(self, spec_path: str, mtime_ns: int, size: int, data: dict):
+        # yaml may produce values json can't hold (dates, non string keys), and
+        # those specs are simply not cached
+        try:
+            if json.loads(json.dumps(data)) != data:
+                return
+        except (TypeError, ValueError):
+            return
+
+        with self._lock:
+            self._entries[spec_path] = {
+                'mtime_ns': mtime_ns,
+                'size': size,
+                'data': data,
+            }
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+                # write to a temporary file first, so that concurrent runs
+                # never read a partially written cache
+                tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w') as fh:
+                    json.dump(self._entries, fh)
+
+                os.replace(tmp_path, self.path)
+            except OSError:
+                return
+
+            self._dirty = False
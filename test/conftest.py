@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+from dotdot.pkg import Package
+
+# dots loaded with their default variant
+TEST_DOTS = ('pkg1', 'pkg2', 'pkg3')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def mock_home():
+    # every test sees the repo root as HOME. tests that need another home
+    # patch it themselves
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('HOME', os.getcwd())
+        yield
+
+
+@pytest.fixture(scope='session')
+def home(mock_home):
+    return os.environ['HOME']
+
+
+@pytest.fixture(scope='session')
+def loaded_pkgs():
+    # packages are never modified by the tests, load them only once
+    return {
+        name: Package.from_dot_path(f'test/dots/{name}')
+        for name in TEST_DOTS
+    }
+
+
+@pytest.fixture(scope='session')
+def scanned():
+    return Package.scan('test/dots')
+
+
+@pytest.fixture
+def pkg_path(tmp_path):
+    # an empty package, tests add the files they link
+    path = tmp_path / 'pkg'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def tmp_home(tmp_path, monkeypatch):
+    # an empty HOME for tests that change it
+    path = tmp_path / 'home'
+    path.mkdir()
+    monkeypatch.setenv('HOME', str(path))
+    return path
@@ -1,26 +1,33 @@
-from pathlib import Path
 import pytest
 import os
+import shutil
+import subprocess
 
-from dotdot.actions import SymlinkAction
+from dotdot.actions import (
+    ExecuteAction,
+    GitCloneAction,
+    MkdirAction,
+    SymlinkAction,
+    execute_all,
+    expand_home,
+    materialize_all,
+    mk_backup_name,
+    mk_link_target,
+    nested_destinations)
 
-# @pytest.fixture
-# def mock_home(monkeypatch):
-#     monkeypatch.setenv('HOME', os.getcwd())
 
-
-def test_final_paths_updates_object_path():
+def test_final_paths_updates_object_path(home):
     action = SymlinkAction(package_path='pkg/path', source='a_file', destination='.a_file')
 
     result = action.materialize()
 
     assert result == SymlinkAction(
-        package_path=str(Path.home()),
+        package_path=home,
         source=os.path.abspath('pkg/path/a_file'),
-        destination=os.path.expanduser('~/.a_file')
+        destination=os.path.join(home, '.a_file')
     )
 
-def test_final_paths_ignores_non_local_object():
+def test_final_paths_ignores_non_local_object(home):
     action = SymlinkAction(
         package_path='pkg/path',
         source='http://some.file/at/path',
@@ -31,8 +38,328 @@ def test_final_paths_ignores_non_local_object():
     result = action.materialize()
 
     assert result == SymlinkAction(
-        package_path=str(Path.home()),
+        package_path=home,
         source='http://some.file/at/path',
-        destination=os.path.expanduser('~/.a_file'),
+        destination=os.path.join(home, '.a_file'),
         source_is_local=False
     )
+
+
+def test_materialize_all_matches_materialize():
+    actions = [
+        SymlinkAction(package_path='pkg/path', source='a_file', destination='.a_file'),
+        SymlinkAction(package_path='pkg/other', source='b_file', destination='.b_file'),
+    ]
+
+    result = materialize_all(actions)
+
+    assert result == [action.materialize() for action in actions]
+
+
+def test_execute_all_links_into_new_directories(pkg_path, tmp_home):
+    (pkg_path / 'a_file').write_text('a')
+    (pkg_path / 'b_file').write_text('b')
+
+    actions = [
+        SymlinkAction(package_path=str(pkg_path), source='a_file', destination='.config/app/a_file'),
+        SymlinkAction(package_path=str(pkg_path), source='b_file', destination='.config/app/b_file'),
+    ]
+
+    execute_all(materialize_all(actions))
+
+    assert (tmp_home / '.config/app/a_file').read_text() == 'a'
+    assert (tmp_home / '.config/app/b_file').read_text() == 'b'
+
+
+def test_execute_all_links_into_earlier_links(pkg_path, tmp_home):
+    (pkg_path / 'vim').mkdir()
+    (pkg_path / 'extra').write_text('extra')
+
+    # the second link goes through the first one, into the package
+    actions = [
+        SymlinkAction(package_path=str(pkg_path), source='vim', destination='.vim'),
+        SymlinkAction(package_path=str(pkg_path), source='extra', destination='.vim/extra'),
+    ]
+
+    execute_all(materialize_all(actions))
+
+    assert os.path.islink(tmp_home / '.vim')
+    assert os.path.islink(pkg_path / 'vim' / 'extra')
+    assert not os.path.lexists(tmp_home / '_vim.bk')
+
+
+def test_execute_all_links_large_batches_in_order(pkg_path, tmp_home, capsys):
+    names = [f'file{i:02}' for i in range(20)]
+    for name in names:
+        (pkg_path / name).write_text(name)
+
+    actions = materialize_all([
+        SymlinkAction(package_path=str(pkg_path), source=name, destination=f'.app/{name}')
+        for name in names
+    ])
+
+    execute_all(actions)
+
+    for name in names:
+        assert (tmp_home / '.app' / name).read_text() == name
+
+    printed = capsys.readouterr().out.splitlines()
+    assert printed == [action.msg() for action in actions]
+
+
+def test_execute_all_shows_failing_link(pkg_path, tmp_home, monkeypatch, capsys):
+    # a single worker runs the groups after the failing one only once it
+    # failed, and they must not change anything
+    monkeypatch.setattr('dotdot.actions.SYMLINK_WORKERS', 1)
+
+    names = [f'file{i:02}' for i in range(10)]
+    for name in names:
+        (pkg_path / name).write_text(name)
+    (tmp_home / '.blocker').write_text('')
+
+    # the link into .blocker fails, since it's a file. Every link after it
+    # goes into its own directory
+    def destination(i, name):
+        if i < 5:
+            return f'.app/{name}'
+        return f'.blocker/{name}' if i == 5 else f'.after{i}/{name}'
+
+    actions = materialize_all([
+        SymlinkAction(
+            package_path=str(pkg_path),
+            source=name,
+            destination=destination(i, name))
+        for i, name in enumerate(names)
+    ])
+
+    with pytest.raises(OSError):
+        execute_all(actions)
+
+    printed = capsys.readouterr().out.splitlines()
+    assert printed == [action.msg() for action in actions[:6]]
+
+    for action in actions[6:]:
+        assert not os.path.lexists(os.path.dirname(action.destination))
+
+
+def test_execute_all_links_many_directories_with_few_descriptors(pkg_path, tmp_home):
+    resource = pytest.importorskip('resource')
+
+    (pkg_path / 'a_file').write_text('a')
+    # existing files are backed up, which lists their directories
+    for i in range(100):
+        (tmp_home / f'.dir{i:03}').mkdir()
+        (tmp_home / f'.dir{i:03}' / 'a_file').write_text('old')
+
+    actions = materialize_all([
+        SymlinkAction(package_path=str(pkg_path), source='a_file', destination=f'.dir{i:03}/a_file')
+        for i in range(100)
+    ])
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(64, hard), hard))
+    try:
+        execute_all(actions)
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    for i in range(100):
+        assert (tmp_home / f'.dir{i:03}' / 'a_file').read_text() == 'a'
+        assert (tmp_home / f'.dir{i:03}' / 'a_file.bk').read_text() == 'old'
+
+
+def test_mk_backup_name_skips_existing_backups(tmp_path):
+    (tmp_path / '.a_file').write_text('')
+    (tmp_path / '_a_file.bk').write_text('')
+    (tmp_path / '_a_file.bk.1').write_text('')
+
+    result = mk_backup_name(str(tmp_path / '.a_file'))
+
+    assert result == str(tmp_path / '_a_file.bk.2')
+
+
+def test_mk_backup_name_goes_past_ten_backups(tmp_path):
+    (tmp_path / '.a_file').write_text('')
+    (tmp_path / '_a_file.bk').write_text('')
+    for i in range(1, 20):
+        (tmp_path / f'_a_file.bk.{i}').write_text('')
+
+    result = mk_backup_name(str(tmp_path / '.a_file'))
+
+    assert result == str(tmp_path / '_a_file.bk.20')
+
+
+def test_mkdir_materialize_is_absolute(home):
+    action = MkdirAction(package_path='pkg/path', target_dir='.local/share')
+
+    result = action.materialize()
+
+    assert result == MkdirAction(
+        package_path=home,
+        target_dir=os.path.join(home, '.local/share')
+    )
+
+
+def test_mkdir_execute_refuses_existing_file(tmp_path):
+    target = tmp_path / 'a_file'
+    target.write_text('')
+
+    MkdirAction(package_path=str(tmp_path), target_dir=str(tmp_path)).execute()
+
+    with pytest.raises(Exception, match='exists as a file'):
+        MkdirAction(
+            package_path=str(tmp_path), target_dir=str(target)).execute()
+
+
+def test_execute_all_backs_up_existing_destination(pkg_path, tmp_home):
+    (pkg_path / 'a_file').write_text('new')
+    (tmp_home / '.a_file').write_text('old')
+
+    actions = [SymlinkAction(package_path=str(pkg_path), source='a_file', destination='.a_file')]
+
+    execute_all(materialize_all(actions))
+    # linking again is a no-op
+    execute_all(materialize_all(actions))
+
+    assert (tmp_home / '.a_file').read_text() == 'new'
+    assert (tmp_home / '_a_file.bk').read_text() == 'old'
+    assert not (tmp_home / '_a_file.bk.1').exists()
+
+
+@pytest.mark.parametrize('source, dest_dir', [
+    ('/src/dots/pkg/file', '/home/user'),
+    ('/src/dots/pkg/file', '/src/dots/pkg'),
+    ('/src/dots/pkg/dir/file', '/src/dots/pkg/dir/sub'),
+    ('/src/dots/pkg', '/src/dots/pkg/dir'),
+    ('/src/dots/pkg', '/src/dots/pkg'),
+    ('/src/dots/pkg/file', '/src/dots/pkgs/dir'),
+])
+def test_mk_link_target_matches_relpath(source, dest_dir):
+    assert mk_link_target(source, dest_dir) == os.path.relpath(source, dest_dir)
+
+
+@pytest.mark.parametrize('destinations,expected', [
+    pytest.param(['/h/.a', '/h/.b/c', '/h/.a-b/c'], False, id='distinct'),
+    pytest.param(['/h/.a', '/h/.b', '/h/.a'], True, id='repeated'),
+    pytest.param(['/h/.a/b/c', '/h/.a'], True, id='ancestor'),
+])
+def test_nested_destinations(destinations, expected):
+    assert nested_destinations(destinations) == expected
+
+
+def test_mk_backup_name_reserves_returned_names(tmp_path):
+    (tmp_path / '.a_file').write_text('')
+
+    first = mk_backup_name(str(tmp_path / '.a_file'))
+    second = mk_backup_name(str(tmp_path / '.a_file'))
+
+    assert first == str(tmp_path / '_a_file.bk')
+    assert second == str(tmp_path / '_a_file.bk.1')
+
+
+@pytest.mark.parametrize('path', [
+    '~', '~/.vimrc', '.vimrc', '/etc/~hosts', '~root/.bashrc'
+])
+def test_expand_home_matches_expanduser(path):
+    assert expand_home(path, os.path.expanduser('~')) == \
+        os.path.expanduser(path)
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='requires git')
+def test_execute_all_clones_repos_in_order(tmp_path, capsys):
+    actions = []
+    for name in ['a', 'b', 'c']:
+        repo = tmp_path / 'src' / name
+        subprocess.run(['git', 'init', '--quiet', '-b', 'main', str(repo)], check=True)
+        subprocess.run(
+            ['git', '-c', 'user.name=test', '-c', 'user.email=test@test',
+             'commit', '--quiet', '--allow-empty', '-m', name],
+            cwd=repo, check=True)
+
+        actions.append(GitCloneAction(
+            package_path=str(tmp_path),
+            source=str(repo),
+            destination=str(tmp_path / 'dst' / name)))
+
+    execute_all(actions)
+
+    for name in ['a', 'b', 'c']:
+        assert (tmp_path / 'dst' / name / '.git').is_dir()
+
+    printed = [
+        line for line in capsys.readouterr().out.splitlines()
+        if line.startswith('GITCLONE')
+    ]
+    assert printed == [action.msg() for action in actions]
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='requires git')
+def test_execute_all_shows_failing_clone(tmp_path, capsys):
+    repo = tmp_path / 'src' / 'a'
+    subprocess.run(['git', 'init', '--quiet', '-b', 'main', str(repo)], check=True)
+    subprocess.run(
+        ['git', '-c', 'user.name=test', '-c', 'user.email=test@test',
+         'commit', '--quiet', '--allow-empty', '-m', 'a'],
+        cwd=repo, check=True)
+
+    # the first repo does not exist, and fetching it fails
+    actions = [
+        GitCloneAction(
+            package_path=str(tmp_path),
+            source=str(tmp_path / 'src' / name),
+            destination=str(tmp_path / 'dst' / name))
+        for name in ['missing', 'a']
+    ]
+
+    with pytest.raises(subprocess.CalledProcessError):
+        execute_all(actions)
+
+    printed = capsys.readouterr().out.splitlines()
+    failed = printed[:printed.index(actions[1].msg())]
+    assert failed[:3] == [
+        actions[0].msg(),
+        f'- Initialize repo at {actions[0].destination}',
+        '- Fetching changes',
+    ]
+    # the error of git is shown along with the progress
+    assert len(failed) > 3
+
+    # the clone running alongside is still shown
+    assert (tmp_path / 'dst' / 'a' / '.git').is_dir()
+
+
+def test_execute_all_runs_execute_rules_in_isolation(tmp_path):
+    first = tmp_path / 'first'
+    second = tmp_path / 'second'
+    first.mkdir()
+    second.mkdir()
+
+    actions = [
+        ExecuteAction(str(first), ['VAR=set', 'echo "$VAR" > out']),
+        ExecuteAction(str(second), ['echo "$VAR" > out', 'false']),
+        ExecuteAction(str(first), ['touch never']),
+    ]
+
+    with pytest.raises(Exception, match='Failed during execute action'):
+        execute_all(actions)
+
+    assert (first / 'out').read_text() == 'set\n'
+    assert (second / 'out').read_text() == '\n'
+    assert not (first / 'never').exists()
+
+
+def test_execute_all_runs_large_execute_rules(tmp_path):
+    # larger than what a single argument may hold
+    value = 'a' * 140_000
+
+    single = [ExecuteAction(str(tmp_path), [f'x={value}', 'echo "${#x}" > single'])]
+    batch = [
+        ExecuteAction(str(tmp_path), [f'x={value}', 'echo "${#x}" > first']),
+        ExecuteAction(str(tmp_path), [f'x={value}', 'echo "${#x}" > second']),
+    ]
+
+    execute_all(single)
+    execute_all(batch)
+
+    for name in ['single', 'first', 'second']:
+        assert (tmp_path / name).read_text() == '140000\n'
@@ -1,118 +1,127 @@
-import os
-import pytest
-
 from dotdot.pkg import Package
+from dotdot.spec_cache import SpecCache
 from dotdot.actions import GitCloneAction, SymlinkAction, SymlinkRecursiveAction, ExecuteAction, CopyAction
 
 
-@pytest.fixture
-def mock_home(monkeypatch):
-    monkeypatch.setenv('HOME', os.getcwd())
-
-
-def test_load_from_folder(mock_home):
-    pkg = Package.from_dot_path('test/dots/pkg1')
-
-    # The returned paths are absolute, but since we do not want
-
-    expected = Package(
-        'pkg1',
-        'package1',
-        'test/dots/pkg1',
-        variants={'default'},
-        actions=[
-            SymlinkAction(
-                'test/dots/pkg1',
-                source='file1',
-                destination='.file1'),
-            CopyAction(
-                'test/dots/pkg1',
-                source='file1',
-                destination='file1_again'),
-            SymlinkRecursiveAction(
-                package_path='test/dots/pkg1',
-                source='dir1',
-                destination='.dir1'),
-            SymlinkAction(
-                package_path='test/dots/pkg1',
-                source='dir1/file_in_dir_1',
-                destination='.dir1/file_in_dir_1',
-            ),
-            SymlinkAction(
-                package_path='test/dots/pkg1',
-                source='dir1/subdir1/file_in_subdir1',
-                destination='.dir1/subdir1/file_in_subdir1',
-            ),
-            SymlinkRecursiveAction(
-                package_path='test/dots/pkg1',
-                source='dir2',
-                destination='user_dir_2'),
-            ExecuteAction(
-                package_path='test/dots/pkg1',
-                cmds=[
-                    'echo cmd1',
-                    'echo cmd2',
-                    ('echo cmd3\n'
-                     '[ "a" == "b" ]\n'
-                     'echo cmd4\n')
-                ]),
-            ExecuteAction(package_path='test/dots/pkg1',
-                          cmds=['./cmd.sh']),
-            GitCloneAction(
-                package_path='test/dots/pkg1',
-                source='https://github.com/kassick/evil-iedit-state',
-                destination='tmp/evil-iedit-state')
-        ])
-
-    assert expected == pkg
-
-
-def test_load_from_file(mock_home):
+# expected packages are never modified, build them once
+EXPECTED_PKG1 = Package(
+    'pkg1',
+    'package1',
+    'test/dots/pkg1',
+    variants={'default'},
+    actions=[
+        SymlinkAction(
+            'test/dots/pkg1',
+            source='file1',
+            destination='.file1'),
+        CopyAction(
+            'test/dots/pkg1',
+            source='file1',
+            destination='file1_again'),
+        SymlinkRecursiveAction(
+            package_path='test/dots/pkg1',
+            source='dir1',
+            destination='.dir1'),
+        SymlinkAction(
+            package_path='test/dots/pkg1',
+            source='dir1/file_in_dir_1',
+            destination='.dir1/file_in_dir_1',
+        ),
+        SymlinkAction(
+            package_path='test/dots/pkg1',
+            source='dir1/subdir1/file_in_subdir1',
+            destination='.dir1/subdir1/file_in_subdir1',
+        ),
+        SymlinkRecursiveAction(
+            package_path='test/dots/pkg1',
+            source='dir2',
+            destination='user_dir_2'),
+        ExecuteAction(
+            package_path='test/dots/pkg1',
+            cmds=[
+                'echo cmd1',
+                'echo cmd2',
+                ('echo cmd3\n'
+                 '[ "a" == "b" ]\n'
+                 'echo cmd4\n')
+            ]),
+        ExecuteAction(package_path='test/dots/pkg1',
+                      cmds=['./cmd.sh']),
+        GitCloneAction(
+            package_path='test/dots/pkg1',
+            source='https://github.com/kassick/evil-iedit-state',
+            destination='tmp/evil-iedit-state')
+    ])
+
+
+EXPECTED_PKG2 = Package(
+    'pkg2',
+    None,
+    'test/dots',
+    variants={'default'},
+    actions=[
+        SymlinkAction('test/dots',
+                      'pkg2',
+                      '.pkg2'),
+    ])
+
+
+EXPECTED_PKG3 = Package(
+    'pkg3',
+    None,
+    'test/dots/pkg3',
+    variants={'default'},
+    actions=[
+        SymlinkAction('test/dots/pkg3',
+                      'afile',
+                      '.afile'),
+        SymlinkAction('test/dots/pkg3',
+                      'other_file',
+                      '.other_file')
+    ])
+
+
+PKG6_PATH = 'test/dots/pkg6_variants'
+EXPECTED_PKG6_FEDORA = Package(
+    'pkg6_variants',
+    'A Package with variants',
+    PKG6_PATH,
+    variants={'fedora',
+              'ubuntu',
+              'default'},
+    actions=[
+        ExecuteAction(PKG6_PATH, ['echo fedora only first']),
+        ExecuteAction(PKG6_PATH, ['echo cmd1']),
+        ExecuteAction(PKG6_PATH, ['echo cmd2\necho cmd3\n']),
+        ExecuteAction(PKG6_PATH, ['echo fedora only last'])
+    ])
+
+
+def test_load_from_folder(loaded_pkgs):
+    pkg = loaded_pkgs['pkg1']
+
+    assert EXPECTED_PKG1 == pkg
+
+
+def test_load_from_file(loaded_pkgs):
     # pkg2 is a simple file
     # actions should symlink the file pkg2 on test/dots to ~/.pkg2
-    pkg = Package.from_dot_path('test/dots/pkg2')
-
-    # The returned paths are absolute, but since we do not want
-
-    expected = Package(
-        'pkg2',
-        None,
-        'test/dots',
-        variants={'default'},
-        actions=[
-            SymlinkAction('test/dots',
-                          'pkg2',
-                          '.pkg2'),
-        ])
+    pkg = loaded_pkgs['pkg2']
 
-    assert expected == pkg
+    assert EXPECTED_PKG2 == pkg
 
 
-def test_load_from_folder_with_no_spec(mock_home):
+def test_load_from_folder_with_no_spec(loaded_pkgs):
     # pkg3 is a folder without spec
     # default action is to assume that there'd be a symlink every file under
     # the path
-    pkg = Package.from_dot_path('test/dots/pkg3')
-
-    # The returned paths are absolute, but since we do not want
-
-    expected = Package(
-        'pkg3',
-        None,
-        'test/dots/pkg3',
-        variants={'default'},
-        actions=[
-            SymlinkAction('afile',
-                          '.afile'),
-            SymlinkAction('other_file',
-                          '.other_file')
-        ])
+    pkg = loaded_pkgs['pkg3']
 
-    assert expected == pkg
+    assert EXPECTED_PKG3 == pkg
 
 
-def test_scan(mock_home):
-    pkgs, errors = Package.scan('test/dots')
+def test_scan(scanned):
+    pkgs, errors = scanned
 
     pkg_names = {(pkg.name) for pkg in pkgs}
     expected = {'pkg1', 'pkg2', 'pkg3', 'pkg6_variants'}
@@ -120,25 +129,45 @@ def test_scan(mock_home):
     assert pkg_names == expected
 
 
-def test_variant(mock_home):
-    pkg_path = 'test/dots/pkg6_variants'
-    result = Package.from_dot_path(pkg_path, variant='fedora')
-
-    def exe(cmds):
-        return ExecuteAction(pkg_path, cmds)
-
-    expected = Package(
-        'pkg6_variants',
-        'A Package with variants',
-        pkg_path,
-        variants={'fedora',
-                  'ubuntu',
-                  'default'},
-        actions=[
-            exe(['echo fedora only first']),
-            exe(['echo cmd1']),
-            exe(['echo cmd2\necho cmd3\n']),
-            exe(['echo fedora only last'])
-        ])
+def test_variant():
+    result = Package.from_dot_path(PKG6_PATH, variant='fedora')
+
+    assert result == EXPECTED_PKG6_FEDORA
+
+
+def test_spec_is_reloaded_when_changed(tmp_path):
+    pkg_path = tmp_path / 'pkg'
+    pkg_path.mkdir()
+    spec = pkg_path / 'spec.yaml'
+
+    spec.write_text('description: first\n')
+    assert Package.from_dot_path(str(pkg_path)).description == 'first'
+
+    spec.write_text('description: second one\n')
+    assert Package.from_dot_path(str(pkg_path)).description == 'second one'
+
+
+def test_lazy_load_parses_actions_on_access():
+    eager = Package.from_dot_path('test/dots/pkg1')
+    lazy = Package.from_dot_path('test/dots/pkg1', lazy=True)
+
+    assert lazy.description == eager.description
+    assert list(lazy.actions) == list(eager.actions)
+
+
+def test_spec_cache_skips_parsing_saved_specs(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / 'specs.json')
+
+    spec_cache = SpecCache.load(cache_path)
+    expected = Package.from_dot_path('test/dots/pkg1', spec_cache=spec_cache)
+    spec_cache.save()
+
+    def fail(*args):
+        raise AssertionError('spec should not have been parsed')
+
+    monkeypatch.setattr('dotdot.pkg._load_spec', fail)
+
+    result = Package.from_dot_path(
+        'test/dots/pkg1', spec_cache=SpecCache.load(cache_path))
 
     assert result == expected
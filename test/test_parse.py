@@ -1,7 +1,7 @@
+import os
 from typing import Sequence
-from unittest import TestCase
 
-import yaml
+import pytest
 
 from dotdot.actions import (
     ExecuteAction,
@@ -10,109 +10,127 @@ from dotdot.actions import (
     SymlinkAction)
 from dotdot.spec import SPEC_FILE_NAME
 
-
-class TestParseSrcDestEntry(TestCase):
-
-    def setUp(self):
-
-        self.single_entry_text = yaml.safe_load(
-            """
-            actions:
-            - link: a_file
-            """)
-
-        self.multiple_entries_text = yaml.safe_load(
-            """
-            actions:
-            - link:
-              - a_file
-              - other_file
-              - yet_another
-            """)
-
-        self.single_entry_dict = yaml.safe_load(
-            """
-            actions:
-            - link:
-              - from: a_file
-                to: some_file
-            """)
-
-        self.multiple_entries_dict = yaml.safe_load(
-            """
-            actions:
-            - link:
-              - from: a_file
-                to: some_file
-              - from: other_file
-                to: other_file_dest
-            """)
-
-        self.single_entry_wildcard_text = yaml.safe_load(
-            # links every file `f` to their corresponting `~/.{f}`
-            """
-            actions:
-            - link: '*'
-            """)
-
-        self.single_entry_wildcard_dict = yaml.safe_load(
-            # links every file `f` to the corresponding `~/.local/share/{f}`
-            """
-            actions:
-            - link:
-              - from: '*'
-                to: .local/share
-            """)
-
-    def test_parse_one_entry_text(self):
-
-        link_single_entry = self.single_entry_text['actions'][0]['link']
-        result = SymlinkAction.parse_one_entry('some_path', link_single_entry)
-
-        expected = [
+# spec entries, as loaded from the yaml
+SINGLE_ENTRY_TEXT = {
+    'actions': [
+        {'link': 'a_file'},
+    ]
+}
+
+MULTIPLE_ENTRIES_TEXT = {
+    'actions': [
+        {'link': ['a_file', 'other_file', 'yet_another']},
+    ]
+}
+
+SINGLE_ENTRY_DICT = {
+    'actions': [
+        {'link': [
+            {'from': 'a_file', 'to': 'some_file'},
+        ]},
+    ]
+}
+
+MULTIPLE_ENTRIES_DICT = {
+    'actions': [
+        {'link': [
+            {'from': 'a_file', 'to': 'some_file'},
+            {'from': 'other_file', 'to': 'other_file_dest'},
+        ]},
+    ]
+}
+
+# links every file `f` to their corresponting `~/.{f}`
+SINGLE_ENTRY_WILDCARD_TEXT = {
+    'actions': [
+        {'link': '*'},
+    ]
+}
+
+# links every file `f` to the corresponding `~/.local/share/{f}`
+SINGLE_ENTRY_WILDCARD_DICT = {
+    'actions': [
+        {'link': [
+            {'from': '*', 'to': '.local/share'},
+        ]},
+    ]
+}
+
+
+def test_parse_one_entry_text():
+    link_single_entry = SINGLE_ENTRY_TEXT['actions'][0]['link']
+    result = SymlinkAction.parse_one_entry('some_path', link_single_entry)
+
+    expected = [
+        SymlinkAction(
+            package_path='some_path',
+            source='a_file',
+            destination='.a_file')
+    ]
+
+    assert result == expected
+
+
+def test_parse_one_entry_dict():
+    # this format has a list as link value, take the first entry
+    link_single_entry = SINGLE_ENTRY_DICT['actions'][0]['link'][0]
+    result = SymlinkAction.parse_one_entry('some_path', link_single_entry)
+
+    expected = [
+        SymlinkAction(
+            package_path='some_path',
+            source='a_file',
+            destination='some_file')
+    ]
+
+    assert result == expected
+
+
+def test_parse_wildcard_lists_new_files(tmp_path):
+    (tmp_path / 'a_file').write_text('')
+    link_entry = SINGLE_ENTRY_WILDCARD_TEXT['actions'][0]['link']
+
+    first = SymlinkAction.parse_entries(str(tmp_path), link_entry)
+
+    (tmp_path / 'b_file').write_text('')
+    # the listing is cached by the directory mtime, make sure it changes even
+    # on filesystems with coarse timestamps
+    st = os.stat(tmp_path)
+    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+
+    second = SymlinkAction.parse_entries(str(tmp_path), link_entry)
+
+    assert [a.source for a in first] == ['a_file']
+    assert [a.source for a in second] == ['a_file', 'b_file']
+
+
+def test_parse_single_entry_wildcard_ignores_spec_file():
+    # spec.yaml can not exist in the list
+    link_entry = SINGLE_ENTRY_WILDCARD_DICT['actions'][0]['link']
+
+    result: Sequence[SymlinkAction] = SymlinkAction.parse_entries(
+        'test/dots/pkg1',
+        link_entry)  # type: ignore
+    files = {l.source for l in result}
+
+    assert SPEC_FILE_NAME not in files
+
+
+LINK_CASES = [
+    pytest.param(
+        'some_path',
+        SINGLE_ENTRY_TEXT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='some_path',
                 source='a_file',
-                destination='.a_file')
-        ]
-
-        assert result == expected
-
-    def test_parse_one_entry_dict(self):
-
-        # this format has a list as link value, take the first entry
-        link_single_entry = self.single_entry_dict['actions'][0]['link'][0]
-        result = SymlinkAction.parse_one_entry('some_path', link_single_entry)
-
-        expected = [
-            SymlinkAction(
-                package_path='some_path',
-                source='a_file',
-                destination='some_file')
-        ]
-
-        assert result == expected
-
-    def test_parse_single_entry_text(self):
-        link_entry = self.single_entry_text['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('some_path', link_entry)
-
-        expected = [
-            SymlinkAction(
-                package_path='some_path',
-                source='a_file',
-                destination='.a_file')
-        ]
-
-        assert result == expected
-
-    def test_parse_multiple_entries_text(self):
-        link_entry = self.multiple_entries_text['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('some_path', link_entry)
-
-        expected = [
+                destination='.a_file'),
+        ],
+        id='single_entry_text'),
+    pytest.param(
+        'some_path',
+        MULTIPLE_ENTRIES_TEXT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='some_path',
                 source='a_file',
@@ -125,30 +143,22 @@ class TestParseSrcDestEntry(TestCase):
                 package_path='some_path',
                 source='yet_another',
                 destination='.yet_another'),
-        ]
-
-        assert result == expected
-
-    def test_parse_single_entry_dict(self):
-        link_entry = self.single_entry_dict['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('some_path', link_entry)
-
-        expected = [
+        ],
+        id='multiple_entries_text'),
+    pytest.param(
+        'some_path',
+        SINGLE_ENTRY_DICT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='some_path',
                 source='a_file',
-                destination='some_file')
-        ]
-
-        assert result == expected
-
-    def test_parse_multiple_entries_dict(self):
-        link_entry = self.multiple_entries_dict['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('some_path', link_entry)
-
-        expected = [
+                destination='some_file'),
+        ],
+        id='single_entry_dict'),
+    pytest.param(
+        'some_path',
+        MULTIPLE_ENTRIES_DICT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='some_path',
                 source='a_file',
@@ -157,16 +167,12 @@ class TestParseSrcDestEntry(TestCase):
                 package_path='some_path',
                 source='other_file',
                 destination='other_file_dest'),
-        ]
-
-        assert result == expected
-
-    def test_parse_single_entry_wildcard_text(self):
-        link_entry = self.single_entry_wildcard_text['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('test/dots/pkg3', link_entry)
-
-        expected = [
+        ],
+        id='multiple_entries_dict'),
+    pytest.param(
+        'test/dots/pkg3',
+        SINGLE_ENTRY_WILDCARD_TEXT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='test/dots/pkg3',
                 source='afile',
@@ -175,16 +181,12 @@ class TestParseSrcDestEntry(TestCase):
                 package_path='test/dots/pkg3',
                 source='other_file',
                 destination='.other_file'),
-        ]
-
-        assert result == expected
-
-    def test_parse_single_entry_wildcard_dict(self):
-        link_entry = self.single_entry_wildcard_dict['actions'][0]['link']
-
-        result = SymlinkAction.parse_entries('test/dots/pkg3', link_entry)
-
-        expected = [
+        ],
+        id='single_entry_wildcard_text'),
+    pytest.param(
+        'test/dots/pkg3',
+        SINGLE_ENTRY_WILDCARD_DICT['actions'][0]['link'],
+        [
             SymlinkAction(
                 package_path='test/dots/pkg3',
                 source='afile',
@@ -193,136 +195,101 @@ class TestParseSrcDestEntry(TestCase):
                 package_path='test/dots/pkg3',
                 source='other_file',
                 destination='.local/share/other_file'),
-        ]
-
-        assert result == expected
-
-    def test_parse_single_entry_wildcard_ignores_spec_file(self):
-        # spec.yaml can not exist in the list
-        link_entry = self.single_entry_wildcard_dict['actions'][0]['link']
-
-        result: Sequence[SymlinkAction] = SymlinkAction.parse_entries(
-            'test/dots/pkg1',
-            link_entry)  # type: ignore
-        files = {l.source for l in result}
-
-        assert SPEC_FILE_NAME not in files
-
-
-class TestParseGitClone(TestCase):
-
-    def setUp(self):
-
-        self.invalid_entry_str = yaml.safe_load(
-            """
-            actions:
-            - gitclone: git@url:/path
-            """)
-
-        self.invalid_entry_dict = yaml.safe_load(
-            """
-            actions:
-            - gitclone:
-              - from: git@url:/path
-                to: .local/repo
-            """)
-
-        self.entry_without_branch = yaml.safe_load(
-            """
-            actions:
-            - gitclone:
-              - url: git@url:/path
-                to: .local/repo
-            """)
-
-        self.entry_with_branch = yaml.safe_load(
-            """
-            actions:
-            - gitclone:
-              - url: git@url:/path
-                to: .local/repo
-                branch: main
-            """)
-
-    def test_parse_one_entry_raises_with_str(self):
-
-        entry = self.invalid_entry_str['actions'][0]['gitclone']
-
-        with self.assertRaises(InvalidActionDescription):
-            GitCloneAction.parse_one_entry('some_path', entry)
-
-    def test_parse_one_entry_raises_with_dict(self):
-
-        entry = self.invalid_entry_dict['actions'][0]['gitclone'][0]
-
-        with self.assertRaises(InvalidActionDescription):
-            GitCloneAction.parse_one_entry('some_path', entry)
-
-    def test_parse_one_entry_accepts_fields(self):
-
-        entry = self.entry_without_branch['actions'][0]['gitclone'][0]
-
-        result = GitCloneAction.parse_one_entry('some_path', entry)
-
-        expected = [
-            GitCloneAction(
-                package_path='some_path',
-                source='git@url:/path',
-                destination='.local/repo',
-                branch=None)
-        ]
-
-        assert result == expected
-
-    def test_parse_one_entry_accepts_fields_with_branch(self):
-
-        entry = self.entry_with_branch['actions'][0]['gitclone'][0]
-
-        result = GitCloneAction.parse_one_entry('some_path', entry)
-
-        expected = [
-            GitCloneAction(
-                package_path='some_path',
-                source='git@url:/path',
-                destination='.local/repo',
-                branch='main')
-        ]
-
-        assert result == expected
-
-
-class TestParseExecute(TestCase):
-
-    def setUp(self):
-        self.entry_single_cmd = yaml.safe_load(
-            """
-            actions:
-            - execute: ls
-            """)
-
-        self.entry_multiple_cmds = yaml.safe_load(
-            """
-            actions:
-            - execute:
-              - export VAR=value
-              - ls $VAR
-            """)
-
-    def test_parse_single_entry(self):
-        entry = self.entry_single_cmd['actions'][0]['execute']
-        result = ExecuteAction.parse_entries('some_path', entry)
-        expected = [ExecuteAction(package_path='some_path', cmds=['ls'])]
-
-        assert result == expected
-
-    def test_parse_multiple_entries(self):
-        entry = self.entry_multiple_cmds['actions'][0]['execute']
-        result = ExecuteAction.parse_entries('some_path', entry)
-        expected = [
+        ],
+        id='single_entry_wildcard_dict'),
+]
+
+
+@pytest.mark.parametrize('package_path,link_entry,expected', LINK_CASES)
+def test_parse_link_entries(package_path, link_entry, expected):
+    result = SymlinkAction.parse_entries(package_path, link_entry)
+
+    assert result == expected
+
+
+# git_clone entries that are not a dict with url and to
+INVALID_ENTRY_STR = 'git@url:/path'
+INVALID_ENTRY_DICT = {'from': 'git@url:/path', 'to': '.local/repo'}
+
+ENTRY_WITHOUT_BRANCH = {
+    'actions': [
+        {'gitclone': [
+            {'url': 'git@url:/path', 'to': '.local/repo'},
+        ]},
+    ]
+}
+
+ENTRY_WITH_BRANCH = {
+    'actions': [
+        {'gitclone': [
+            {'url': 'git@url:/path', 'to': '.local/repo', 'branch': 'main'},
+        ]},
+    ]
+}
+
+
+@pytest.mark.parametrize('entry', [
+    pytest.param(INVALID_ENTRY_STR, id='str'),
+    pytest.param(INVALID_ENTRY_DICT, id='dict'),
+])
+def test_parse_gitclone_entry_raises(entry):
+    with pytest.raises(InvalidActionDescription):
+        GitCloneAction.parse_one_entry('some_path', entry)
+
+
+@pytest.mark.parametrize('entry,branch', [
+    pytest.param(
+        ENTRY_WITHOUT_BRANCH['actions'][0]['gitclone'][0],
+        None,
+        id='without_branch'),
+    pytest.param(
+        ENTRY_WITH_BRANCH['actions'][0]['gitclone'][0],
+        'main',
+        id='with_branch'),
+])
+def test_parse_gitclone_entry_accepts_fields(entry, branch):
+    result = GitCloneAction.parse_one_entry('some_path', entry)
+
+    expected = [
+        GitCloneAction(
+            package_path='some_path',
+            source='git@url:/path',
+            destination='.local/repo',
+            branch=branch)
+    ]
+
+    assert result == expected
+
+
+ENTRY_SINGLE_CMD = {
+    'actions': [
+        {'execute': 'ls'},
+    ]
+}
+
+ENTRY_MULTIPLE_CMDS = {
+    'actions': [
+        {'execute': ['export VAR=value', 'ls $VAR']},
+    ]
+}
+
+
+@pytest.mark.parametrize('entry,expected', [
+    pytest.param(
+        ENTRY_SINGLE_CMD['actions'][0]['execute'],
+        [ExecuteAction(package_path='some_path', cmds=['ls'])],
+        id='single_cmd'),
+    pytest.param(
+        ENTRY_MULTIPLE_CMDS['actions'][0]['execute'],
+        [
             ExecuteAction(
                 package_path='some_path',
                 cmds=['export VAR=value',
                       'ls $VAR'])
-        ]
+        ],
+        id='multiple_cmds'),
+])
+def test_parse_execute_entries(entry, expected):
+    result = ExecuteAction.parse_entries('some_path', entry)
 
-        assert result == expected
+    assert result == expected